@@ -5,9 +5,18 @@ import sys
 import os
 
 import time
+import json
+import csv
+import hashlib
+import tempfile
+import mmap
+import struct
+from collections import OrderedDict
 import _io
+from array import array
 
 PROGRAM_NAME = os.path.basename(sys.argv[0])
+PROGRAM_VERSION = "1.1"        # part of the cache key, change it when the output of the compressor changes
 ROOT_DIR = Path(__file__).parent
 
 PLATFORMS = ["pc", "psx"]
@@ -36,6 +45,20 @@ CMAP_COLUMN_OFFSET = 256*256*2
 
 EMPTY_BLOCK_DATA = bytes( [ 0 for _ in range(BLOCK_INFO_SIZE) ] )
 
+UMAP_ROW_SIZE = (MAP_WIDTH+1)*BLOCK_INFO_SIZE          # one row of blocks of a single z-plane
+UMAP_PLANE_SIZE = (MAP_HEIGHT+1)*UMAP_ROW_SIZE         # one z-plane of blocks
+
+MAP_CHUNK_HEADERS = ["UMAP", "CMAP", "DMAP"]    # big chunks, they aren't kept in memory
+
+EMPTY_UMAP_ROW = bytes(UMAP_ROW_SIZE)
+EMPTY_SPAN_WIDTH = 16                               # check if the columns are empty in spans of x columns
+EMPTY_UMAP_SPAN = bytes(EMPTY_SPAN_WIDTH*BLOCK_INFO_SIZE)
+EMPTY_SCAN_ROWS = 16                                # read x rows at once when checking if a z-plane is empty
+EMPTY_MAP_ROW = [ None for _ in range(MAP_WIDTH+1) ]
+EMPTY_COLUMN_BLOCKS = tuple( EMPTY_BLOCK_DATA for _ in range(MAP_MAX_Z+1) )
+EMPTY_DMAP_COLUMN = bytes([0, MAP_MAX_Z+1, 0, 0])     # height, offset & padding of a column without blocks
+EMPTY_CMAP_COLUMN = bytes([0, MAP_MAX_Z+1])           # height & offset of a column without blocks
+
 WORD_SIZE = 2
 DWORD_SIZE = 4
 
@@ -48,7 +71,32 @@ CHUNK_PADDING_BYTE = bytes([int("0xAA", 16)])   # only for cmap/psx gmp maps
 
 WORD_MAX_VALUE = 65535  # 0xFFFF
 
-PERCENTAGE_UPDATE_SECONDS = 1   # update percentage after x seconds
+PROGRESS_UPDATE_ROWS = 8       # check progress after x map rows
+PROGRESS_UPDATE_SECONDS = 1     # only redraw the tty progress bar after x seconds
+PROGRESS_BAR_WIDTH = 30
+
+PROGRESS_SINKS = ["tty", "quiet", "json"]
+
+STATS_REGION_SIZE = 16                                  # width/height of a stats region, in columns
+STATS_REGIONS_PER_ROW = (MAP_WIDTH+1) // STATS_REGION_SIZE
+STATS_HEATMAP_CHARS = " .:-=+*#%@"                      # from lowest to highest value
+STATS_TOP_REGIONS = 10
+
+PSX_MAX_TILE_INDEX = 383
+PSX_DIAGONAL_SLOPE_TILE = 1023              # lid tile of diagonal slopes, converted by fix_pc_slope
+UNUSED_SLOPE_TYPES = [62]
+BLOCK_FACES = ["left", "right", "top", "bottom", "lid"]
+LINT_MAX_COORDS = 8                         # max coordinates reported for each problem
+
+SIDE_NO_TILE_MASK = 0x1FFF                  # keep wall, bullet wall & flat bits of sides without tile (clear flip & rotation)
+LID_NO_TILE_MASK = 0x13FF                   # keep flat bit of lids without tile (clear lighting, flip & rotation)
+
+COLUMN_CACHE_SIZE = 4096      # max decoded columns kept by CompressedMap
+
+CACHE_FILE_EXTENSION = ".gmp"
+CACHE_DEFAULT_MAX_MB = 512
+CACHE_READ_SIZE = 1024*1024     # read the input map chunk to hash it in pieces of x bytes
+CACHE_TEMP_FILE_MAX_AGE = 60*60 # seconds, older temporary files were left by a job that was killed
 
 # TODO: convert this code to use classes/objects
 class DMAP_compressed:
@@ -62,6 +110,119 @@ class DMAP_compressed:
 class WordConvertionException(Exception):
     pass
 
+class QuietProgressSink:
+    """Progress sink that ignores all events."""
+    def handle(self, event: dict):
+        pass
+
+class TTYProgressSink:
+    """Progress sink that draws a progress bar on a terminal.
+    
+    If the stream isn't a terminal (e.g. a CI log) only the end of each stage is printed."""
+    def __init__(self, stream=None):
+        self.stream = stream if stream is not None else sys.stdout
+        self.is_tty = self.stream.isatty()
+        self.last_draw_time = 0
+
+    def handle(self, event: dict):
+        if event["event"] == "progress":
+            if not self.is_tty:
+                return
+            curr_time = time.time()
+            if curr_time - self.last_draw_time < PROGRESS_UPDATE_SECONDS:
+                return
+            self.last_draw_time = curr_time
+
+            fraction = event["rows_done"] / event["total_rows"]
+            filled = int(fraction*PROGRESS_BAR_WIDTH)
+            bar = "#"*filled + " "*(PROGRESS_BAR_WIDTH - filled)
+            self.stream.write(f"[{bar}] {fraction:.0%} ETA {event['eta']:.0f}s \r")
+            self.stream.flush()
+
+        elif event["event"] == "stage_end":
+            if self.is_tty:
+                self.stream.write(" "*(PROGRESS_BAR_WIDTH + 20) + "\r")    # clear the progress bar
+            self.stream.write(f"Finished {event['stage']} in {event['elapsed']:.3f} seconds\n")
+            self.stream.flush()
+
+class JSONLinesProgressSink:
+    """Progress sink that writes every event as a JSON line."""
+    def __init__(self, stream=None):
+        self.stream = stream if stream is not None else sys.stderr
+
+    def handle(self, event: dict):
+        self.stream.write(json.dumps(event) + "\n")
+        self.stream.flush()
+
+class ProgressReporter:
+    """Send progress events of each compression stage to a sink.
+
+    A sink is any object with a 'handle(event: dict)' method. The events are:
+    - {"event": "stage_start", "stage", "total_rows"}
+    - {"event": "progress", "stage", "rows_done", "total_rows", "elapsed", "eta"}
+    - {"event": "stage_end", "stage", "total_rows", "elapsed"}
+    """
+    def __init__(self, sink=None):
+        self.sink = sink if sink is not None else QuietProgressSink()
+        self.stage = None
+        self.total_rows = 0
+        self.start_time = 0
+
+    def start_stage(self, stage, total_rows):
+        self.stage = stage
+        self.total_rows = total_rows
+        self.start_time = time.time()
+        self.sink.handle(dict(event="stage_start", stage=stage, total_rows=total_rows))
+
+    def rows_done(self, rows_done):
+        elapsed = time.time() - self.start_time
+        eta = elapsed*(self.total_rows - rows_done)/rows_done if rows_done else 0.0
+        self.sink.handle(dict(event="progress", stage=self.stage, rows_done=rows_done, 
+                              total_rows=self.total_rows, elapsed=elapsed, eta=eta))
+
+    def end_stage(self):
+        elapsed = time.time() - self.start_time
+        self.sink.handle(dict(event="stage_end", stage=self.stage, total_rows=self.total_rows, elapsed=elapsed))
+        self.stage = None
+
+class CompressionStats:
+    """Statistics of the column builders: which regions of the map introduce new unique columns and blocks.
+
+    The map is split in 16x16 regions of 16x16 columns each. A column or block is accounted 
+    to the region where it appears for the first time (in the order the map is compressed).
+    """
+    def __init__(self, platform):
+        self.platform = platform
+        num_regions = STATS_REGIONS_PER_ROW*STATS_REGIONS_PER_ROW
+        self.region_columns = [0]*num_regions       # new unique columns
+        self.region_blocks = [0]*num_regions        # new unique blocks
+        self.region_bytes = [0]*num_regions         # bytes of the new columns and blocks
+        self.columns = dict()                       # column offset -> [first x, first y, size in bytes, uses]
+
+    def get_region(self, x, y):
+        return (y // STATS_REGION_SIZE)*STATS_REGIONS_PER_ROW + (x // STATS_REGION_SIZE)
+
+    def add_block(self, x, y, size):
+        region = self.get_region(x, y)
+        self.region_blocks[region] += 1
+        self.region_bytes[region] += size
+
+    def add_column(self, x, y, column_offset, size):
+        region = self.get_region(x, y)
+        self.region_columns[region] += 1
+        self.region_bytes[region] += size
+        self.columns[column_offset] = [x, y, size, 0]
+
+    def use_column(self, column_offset):
+        self.columns[column_offset][3] += 1
+
+def create_progress_sink(name):
+    if name == "quiet":
+        return QuietProgressSink()
+    if name == "json":
+        return JSONLinesProgressSink()
+    return TTYProgressSink()
+
 def get_filename(path):
     str_path = str(path)
     i = str_path.rfind('\\') + 1
@@ -93,6 +254,126 @@ def is_slope(block_data):
         return False
     return True
 
+def remap_block_tiles(block_data, tile_remap: dict):
+    """Replace the tile indices of all faces of the block using the tile remap table."""
+    new_block_data = bytes()
+    for face_idx in range(len(BLOCK_FACES)):
+        face_word = int.from_bytes(block_data[face_idx*WORD_SIZE:(face_idx+1)*WORD_SIZE], 'little')
+        tile_idx = face_word & 1023
+        if tile_idx in tile_remap:
+            face_word = (face_word & ~1023) | tile_remap[tile_idx]
+        new_block_data += convert_int_to_word(face_word)
+    return new_block_data + block_data[10:]
+
+def transform_map_rows(map_rows, block_fn, transformed_blocks: dict = None):
+    """Apply block_fn to the blocks of the map rows as they are read. Each unique block is transformed once, 
+    transformed_blocks (block data -> new block data) has the unique blocks read so far."""
+    if transformed_blocks is None:
+        transformed_blocks = dict()
+    for map_row in map_rows:
+        new_row = []
+        for column in map_row:
+            if column is None:     # empty column, block_fn must keep the empty block empty
+                new_row.append(None)
+                continue
+            new_column = []
+            for block_data in column:
+                new_block_data = transformed_blocks.get(block_data)
+                if new_block_data is None:
+                    new_block_data = block_fn(block_data)
+                    transformed_blocks[block_data] = new_block_data
+                new_column.append(new_block_data)
+            new_row.append(tuple(new_column))
+        yield new_row
+
+def count_map_columns(map_rows, columns_set: set):
+    """Add the columns of the map rows to columns_set as they are read. Empty columns are added as EMPTY_COLUMN_BLOCKS."""
+    for map_row in map_rows:
+        for column in map_row:
+            columns_set.add(column if column is not None else EMPTY_COLUMN_BLOCKS)
+        yield map_row
+
+def remap_map_rows(map_rows, tile_remap: dict):
+    """Apply the tile remap table to the map rows as they are read (the tile 0 isn't remapped, so empty blocks stay empty)."""
+    return transform_map_rows(map_rows, lambda block_data: remap_block_tiles(block_data, tile_remap))
+
+def load_tile_remap(remap_path) -> dict:
+    """Read a tile remap table: one "old_tile new_tile" (or "old_tile,new_tile") pair per line, '#' starts a comment."""
+    tile_remap = dict()
+    with open(remap_path, 'r') as file:
+        for line_num, line in enumerate(file, start=1):
+            line = line.split('#')[0].replace(',', ' ').strip()
+            if not line:
+                continue
+            values = line.split()
+            if len(values) != 2 or not values[0].isdigit() or not values[1].isdigit():
+                raise ValueError(f"line {line_num}: expected two tile indices")
+            old_tile, new_tile = int(values[0]), int(values[1])
+            if old_tile > 1023 or new_tile > 1023:
+                raise ValueError(f"line {line_num}: tile indices must be between 0 and 1023")
+            if old_tile == 0:
+                raise ValueError(f"line {line_num}: tile 0 means no tile, it can't be remapped")
+            tile_remap[old_tile] = new_tile
+    return tile_remap
+
+def canonicalize_block(block_data):
+    """Clear the bits that don't change anything in the game, so equal blocks have the same block info:
+    flip/rotation/lighting of faces without tile, and the arrows of air blocks without tiles."""
+    new_block_data = bytes()
+    for face_idx, face_name in enumerate(BLOCK_FACES):
+        face_word = int.from_bytes(block_data[face_idx*WORD_SIZE:(face_idx+1)*WORD_SIZE], 'little')
+        if face_word & 1023 == 0:
+            face_word &= LID_NO_TILE_MASK if face_name == "lid" else SIDE_NO_TILE_MASK
+        new_block_data += convert_int_to_word(face_word)
+
+    # check the block with the faces already cleared, so canonicalizing twice doesn't change it
+    faces_block_data = new_block_data + block_data[10:]
+    arrow_byte = block_data[10]
+    if is_air_block(faces_block_data) and not has_any_tiles(faces_block_data):
+        arrow_byte = 0
+    return new_block_data + bytes([arrow_byte]) + block_data[11:]
+
+def canonicalize_map_rows(map_rows, canonical_counts: dict):
+    """Canonicalize the blocks of the map rows as they are read (see canonicalize_block). Each unique block 
+    is canonicalized once. When all rows are read, canonical_counts has the unique blocks and columns before 
+    and after canonicalizing."""
+    canonical_blocks = dict()
+    columns_set = set()
+    canonical_columns_set = set()
+    map_rows = count_map_columns(map_rows, columns_set)
+    map_rows = transform_map_rows(map_rows, canonicalize_block, canonical_blocks)
+    yield from count_map_columns(map_rows, canonical_columns_set)
+
+    canonical_counts["blocks"] = len(canonical_blocks)
+    canonical_counts["canonical_blocks"] = len(set(canonical_blocks.values()))
+    canonical_counts["columns"] = len(columns_set)
+    canonical_counts["canonical_columns"] = len(canonical_columns_set)
+
+def canonicalize_dmap_blocks(dmap_dict, canonical_counts: dict):
+    """Canonicalize the block info of a DMAP (see canonicalize_block) and count the unique blocks and columns 
+    before and after canonicalizing, like canonicalize_map_rows."""
+    block_list = dmap_dict["block_list"]
+    canonical_block_list = [ canonicalize_block(block_data) for block_data in block_list ]
+
+    column_data = dmap_dict["column_data"]
+    columns_set = set()
+    canonical_columns_set = set()
+    for column_offset in set(dmap_dict["base"]):
+        _, offset, blockds = decode_dmap_column_header(column_data, column_offset)
+
+        # compare the blocks from z = 0 to z = 7, like canonicalize_map_rows
+        bottom = (EMPTY_BLOCK_DATA,)*min(offset, MAP_MAX_Z+1)
+        top = (EMPTY_BLOCK_DATA,)*(MAP_MAX_Z+1 - len(bottom) - len(blockds))
+        columns_set.add( bottom + tuple( block_list[blockd] for blockd in blockds ) + top )
+        canonical_columns_set.add( bottom + tuple( canonical_block_list[blockd] for blockd in blockds ) + top )
+
+    canonical_counts["blocks"] = len(set(block_list))
+    canonical_counts["canonical_blocks"] = len(set(canonical_block_list))
+    canonical_counts["columns"] = len(columns_set)
+    canonical_counts["canonical_columns"] = len(canonical_columns_set)
+
+    dmap_dict["block_list"] = canonical_block_list
+
 # convert PC slope to PSX slope
 def fix_pc_slope(block_data):
     slope_byte = block_data[-1]
@@ -112,7 +393,7 @@ def fix_pc_slope(block_data):
         new_block_data = block_data
     return new_block_data
 
-def detect_headers_and_get_chunks(gmp_path):
+def detect_headers_and_get_chunks(gmp_path, verbose=True):
 
     chunk_info = dict(UMAP = [None, None], 
                    CMAP = [None, None], 
@@ -130,28 +411,41 @@ def detect_headers_and_get_chunks(gmp_path):
 
     with open(gmp_path, 'rb') as file:
         
-        signature = file.read(4).decode('ascii')
-        if (signature != "GBMP"):
+        signature = file.read(4).decode('ascii', errors='replace')
+        is_psx_gmp = signature == "CMAP"    # PSX maps don't have signature, they start with the CMAP chunk
+        if (signature != "GBMP" and not is_psx_gmp):
             print("Error!\n")
             print(f"{gmp_path} is not a gmp file!")
             sys.exit(-1)
 
-        version_code = int.from_bytes(file.read(2),'little')
+        if is_psx_gmp:
+            file.seek(0)
+            if verbose:
+                print("PSX map (no file header)", end="\n\n")
+        else:
+            version_code = int.from_bytes(file.read(2),'little')
 
-        print(f"File Header: {signature}")
-        print(f"Version Code: {version_code}", end="\n\n")
+            if verbose:
+                print(f"File Header: {signature}")
+                print(f"Version Code: {version_code}", end="\n\n")
 
         data_offset = file.tell()
         size = file.seek(0, os.SEEK_END)
         file.seek(data_offset)
 
-        print("File Size: {:,} bytes".format(size))
+        if verbose:
+            print("File Size: {:,} bytes".format(size))
 
         current_offset = data_offset
 
         while (current_offset < size):
             #print(f"Current offset: {file.tell()}")
-            chunk_header = file.read(4).decode('ascii')
+            if is_psx_gmp and file.read(1) == CHUNK_PADDING_BYTE:
+                current_offset += 1     # skip the padding after each PSX chunk (see write_psx_pad)
+                continue
+            file.seek(current_offset)
+
+            chunk_header = file.read(4).decode('ascii', errors='replace')
             current_offset += 4
             if (chunk_header == "UMAP" 
                 or chunk_header == "CMAP"
@@ -171,13 +465,19 @@ def detect_headers_and_get_chunks(gmp_path):
                 header_size = int.from_bytes(file.read(4),'little')
                 chunk_info[chunk_header][1] = header_size
 
-                print(f"Header {chunk_header} found! Offset: {hex(header_data_offset)}, Size: {hex(header_size)}")
+                if verbose:
+                    print(f"Header {chunk_header} found! Offset: {hex(header_data_offset)}, Size: {hex(header_size)}")
 
-                data = file.read(header_size)  # read data
-                data_array.append((chunk_header, data))
+                if chunk_header in MAP_CHUNK_HEADERS:
+                    # map chunks are read on demand from the file, so don't keep a copy of them
+                    file.seek(header_size, os.SEEK_CUR)
+                else:
+                    data = file.read(header_size)  # read data
+                    data_array.append((chunk_header, data))
                 
                 current_offset += header_size
-    print("")
+    if verbose:
+        print("")
     return chunk_info, data_array
 
 def get_block_info_data_from_UMAP(gmp_path, chunk_infos):
@@ -225,6 +525,68 @@ def get_block_info_data_from_UMAP(gmp_path, chunk_infos):
 
     return xyz_array
 
+def is_empty_UMAP_plane(file, plane_offset):
+    file.seek(plane_offset)
+    empty_rows_data = bytes(EMPTY_SCAN_ROWS*UMAP_ROW_SIZE)
+    for _ in range((MAP_HEIGHT+1) // EMPTY_SCAN_ROWS):
+        if file.read(len(empty_rows_data)) != empty_rows_data:
+            return False
+    return True
+
+def iter_UMAP_rows(gmp_path, chunk_infos):
+    """Read the uncompressed map one row at a time.
+
+    For each y yields a list with the 256 columns of that row, where each column is a 
+    tuple with its 8 blocks (from z = 0 to z = 7). Only one row is kept in memory.
+
+    Empty areas are detected in bulk by comparing whole slices of the UMAP with zeros:
+    empty z-planes aren't read, an empty column is None and an empty row is EMPTY_MAP_ROW.
+    """
+    with open(gmp_path, 'rb') as file:
+        umap_offset = chunk_infos["UMAP"][0]
+
+        empty_planes = [ is_empty_UMAP_plane(file, umap_offset + z*UMAP_PLANE_SIZE) for z in range(MAP_MAX_Z+1) ]
+
+        for y in range(MAP_HEIGHT+1):
+            z_rows = []
+            for z in range(MAP_MAX_Z+1):
+                if empty_planes[z]:
+                    z_rows.append(EMPTY_UMAP_ROW)
+                else:
+                    file.seek(umap_offset + z*UMAP_PLANE_SIZE + y*UMAP_ROW_SIZE)
+                    z_rows.append(file.read(UMAP_ROW_SIZE))
+
+            if all(row_data == EMPTY_UMAP_ROW for row_data in z_rows):
+                yield EMPTY_MAP_ROW
+                continue
+
+            map_row = list(EMPTY_MAP_ROW)
+            for span_x in range(0, MAP_WIDTH+1, EMPTY_SPAN_WIDTH):
+                span_start = span_x*BLOCK_INFO_SIZE
+                span_end = span_start + len(EMPTY_UMAP_SPAN)
+                if all(row_data[span_start:span_end] == EMPTY_UMAP_SPAN for row_data in z_rows):
+                    continue
+
+                for x in range(span_x, span_x + EMPTY_SPAN_WIDTH):
+                    i = x*BLOCK_INFO_SIZE
+                    column = tuple(row_data[i:i+BLOCK_INFO_SIZE] for row_data in z_rows)
+                    if column != EMPTY_COLUMN_BLOCKS:
+                        map_row[x] = column
+
+            yield map_row
+
+def iter_block_info_array_rows(block_info_array):
+    """Same as iter_UMAP_rows, but from a block info array already in memory."""
+    for y in range(MAP_HEIGHT+1):
+        yield list(zip(*[ block_info_array[z][y] for z in range(MAP_MAX_Z+1) ]))
+
+def convert_array_to_bytes(int_array: array):
+    """Return the array items as low endian bytes."""
+    if sys.byteorder == "big":
+        int_array = array(int_array.typecode, int_array)
+        int_array.byteswap()
+    return int_array.tobytes()
+
 
 def is_partial_block(block_data) -> bool:
     """A partial block has only lid, i.e. all of its sides doesn't exists."""
@@ -242,248 +604,430 @@ def get_partial_data_from_block(block_data):
     """Return Lid word + arrow byte + slope byte."""
     return block_data[8:]
 
-def create_cmap_columns(block_info_array):
+def create_cmap_columns(map_rows, progress: ProgressReporter = None, stats: CompressionStats = None):
+    """Create the CMAP columns from the map rows (see iter_UMAP_rows) as they are read. Empty columns can be None."""
     columns_array = []
-    columns_set = set()
+    columns_dict = dict()           # column data -> word offset of the column
 
     word_column_offset = 0
     word_columns_offset_array = []
 
-    percentage = 0
-
-    init_time = time.time()
-    old_time = init_time
+    if progress is None:
+        progress = ProgressReporter()
+    progress.start_stage("CMAP columns", MAP_HEIGHT+1)
 
-    cmap_base = [ [ 0 for _ in range(256) ] for _ in range(256) ]   # init
+    # init, base[y*256 + x]. Kept as dwords until the column data size is checked (see save_cmap_columns)
+    cmap_base = array('I', bytes(DWORD_SIZE*256*256))
 
     complete_block_list = []
-    complete_block_set = set()      # speed up process: instead of searching on a list, search on the set
-
-    partial_block_list = [EMPTY_BLOCK_DATA]     # the empty block is always the first
-    partial_block_set = {EMPTY_BLOCK_DATA}      # speed up process
+    complete_block_dict = dict()    # speed up process: instead of searching on a list, search on the dict (block data -> index)
 
-    for y in range(MAP_HEIGHT+1):
-        for x in range(MAP_WIDTH+1):
-            
-            offset = 0
-            height = 0
-            empty_blocks_finished = False
-
-            blockd_array = []
+    partial_block_list = [EMPTY_BLOCK_DATA]         # the empty block is always the first
+    partial_block_dict = {EMPTY_BLOCK_DATA: 0}      # speed up process
 
-            for z in range(MAP_MAX_Z+1):
-                block_data = block_info_array[z][y][x]
-
-                if is_slope(block_data):
-                    block_data = fix_pc_slope(block_data)   # convert PC slope to PSX slope
+    for y, map_row in enumerate(map_rows):
+        for x, column in enumerate(map_row):
+            if column is None:
+                # empty column (see iter_UMAP_rows), there are no blocks to register
+                column_data = EMPTY_CMAP_COLUMN
+            else:
+                offset = 0
+                height = 0
+                empty_blocks_finished = False
 
-                block_in_list = False       # boolean flag to prevent searching twice on the list
-                bis_partial_block = False
+                blockd_array = []
 
-                # now handle block array
-                if is_partial_block(block_data):
-                    # is partial block
-                    bis_partial_block = True
-                    if block_data not in partial_block_set:     # possible hash collision is treated further ahead
-                        partial_block_list.append(block_data)
-                        partial_block_set.add(block_data)
-                    else:
-                        block_in_list = True
+                for z, block_data in enumerate(column):
 
-                else:
-                    # isn't partial block
-                    if block_data not in complete_block_set:     # possible hash collision is treated further ahead
-                        complete_block_list.append(block_data)
-                        complete_block_set.add(block_data)
-                    else:
-                        block_in_list = True
+                    if is_slope(block_data):
+                        block_data = fix_pc_slope(block_data)   # convert PC slope to PSX slope
 
-                # column logic: the first empty blocks (from bottom to top) must be accounted in 'offset'.
-                # If there are empty blocks above the first non-empty block, register blockid = 0.
+                    # now handle block array
+                    if is_partial_block(block_data):
+                        # is partial block
+                        blockd = partial_block_dict.get(block_data)
+                        if blockd is None:
+                            blockd = len(partial_block_list)
+                            partial_block_list.append(block_data)
+                            partial_block_dict[block_data] = blockd
+                            if stats is not None:
+                                stats.add_block(x, y, PARTIAL_BLOCK_INFO_SIZE)
+                        blockd += PARTIAL_BLOCKD_SHIFT
 
-                if block_data == EMPTY_BLOCK_DATA:
-                    if not empty_blocks_finished:
-                        offset += 1
                     else:
-                        blockd_array.append( PARTIAL_BLOCKD_SHIFT + 0 )    # empty blocks has blockd always zero of partial blocks
-                else:
-                    empty_blocks_finished = True
-                    height = z + 1
-
-                    # now register block in blockd array
-
-                    if block_in_list:
-
-                        if bis_partial_block:
-                            # is partial block
-                            # handle eventual hash collisions
-                            try:
-                                blockd_array.append( PARTIAL_BLOCKD_SHIFT + partial_block_list.index(block_data) )
-                            except ValueError:
-                                print("WARNING: Hash Collision detected! Handling it...")
-                                partial_block_list.append(block_data)
-                                blockd_array.append( PARTIAL_BLOCKD_SHIFT + len(partial_block_list) - 1 )
-                        
+                        # isn't partial block
+                        blockd = complete_block_dict.get(block_data)
+                        if blockd is None:
+                            blockd = len(complete_block_list)
+                            complete_block_list.append(block_data)
+                            complete_block_dict[block_data] = blockd
+                            if stats is not None:
+                                stats.add_block(x, y, BLOCK_INFO_SIZE)
+
+                    # column logic: the first empty blocks (from bottom to top) must be accounted in 'offset'.
+                    # If there are empty blocks above the first non-empty block, register blockid = 0.
+
+                    if block_data == EMPTY_BLOCK_DATA:
+                        if not empty_blocks_finished:
+                            offset += 1
                         else:
-                            # isnt partial block
-                            # handle eventual hash collisions
-                            try:
-                                blockd_array.append( complete_block_list.index(block_data) )
-                            except ValueError:
-                                print("WARNING: Hash Collision detected! Handling it...")
-                                complete_block_list.append(block_data)
-                                blockd_array.append( len(complete_block_list) - 1 )
+                            blockd_array.append( PARTIAL_BLOCKD_SHIFT + 0 )    # empty blocks has blockd always zero of partial blocks
                     else:
-                        # register the most recent added block in the array
-                        if bis_partial_block:
-                            blockd_array.append( PARTIAL_BLOCKD_SHIFT + len(partial_block_list) - 1 )  # last index of the list
-                        else:
-                            blockd_array.append( len(complete_block_list) - 1 )  # last index of the list
+                        empty_blocks_finished = True
+                        height = z + 1
 
-            if offset == MAP_MAX_Z:
-                height = 0
-                offset = 0
+                        # now register block in blockd array
+                        blockd_array.append( blockd )
 
-            # encode column height & offset
-            column_data = bytes([height, offset])
+                if offset == MAP_MAX_Z:
+                    height = 0
+                    offset = 0
 
-            num_blocks = height - offset
+                # encode column height & offset
+                column_data = bytes([height, offset])
 
-            # encode blockd
-            for block_col_idx in range(num_blocks):     # ignore the highests empty blocks
-                column_data += convert_int_to_word( blockd_array[block_col_idx] )
+                num_blocks = height - offset
 
-            try:
-                # If not raise exception, there is already the column on the array
-                cmap_base[y][x] = word_columns_offset_array[ columns_array.index(column_data) ]
-            except ValueError:
+                # encode blockd
+                for block_col_idx in range(num_blocks):     # ignore the highests empty blocks
+                    column_data += convert_int_to_word( blockd_array[block_col_idx] )
+
+            column_offset = columns_dict.get(column_data)
+            if column_offset is None:
                 # new column, so register it
-                columns_set.add(column_data)
+                column_offset = word_column_offset
+                columns_dict[column_data] = column_offset
                 columns_array.append(column_data)
 
                 word_columns_offset_array.append(word_column_offset)
-                
-                # encode column dword to populate "data[256][256]"
-                cmap_base[y][x] = word_column_offset
 
                 word_column_offset += len(column_data) // WORD_SIZE    # 2 = size of word
 
-            percentage += 0.00001525878
+                if stats is not None:
+                    stats.add_column(x, y, column_offset, len(column_data))
 
-            curr_time = time.time()
-            if (curr_time - old_time > PERCENTAGE_UPDATE_SECONDS):
-                old_time = curr_time
-                print("{:.0%}".format(percentage), end=" \r")
+            if stats is not None:
+                stats.use_column(column_offset)
+
+            # encode column word to populate "data[256][256]"
+            cmap_base[y*256 + x] = column_offset
 
-    print("100%")
-    print(f"Created columns in {(curr_time - init_time):.3f} seconds")
+        if (y + 1) % PROGRESS_UPDATE_ROWS == 0:
+            progress.rows_done(y + 1)
+
+    progress.end_stage()
 
     return (cmap_base, columns_array, word_columns_offset_array, complete_block_list, partial_block_list)
 
-def create_dmap_columns(block_info_array):
+def create_dmap_columns(map_rows, progress: ProgressReporter = None, stats: CompressionStats = None):
+    """Create the DMAP columns from the map rows (see iter_UMAP_rows) as they are read. Empty columns can be None."""
     columns_array = []
-    columns_set = set()
+    columns_dict = dict()           # column data -> dword offset of the column
 
     dword_column_offset = 0
     dword_columns_offset_array = []
 
-    percentage = 0
-
-    init_time = time.time()
-    old_time = init_time
+    if progress is None:
+        progress = ProgressReporter()
+    progress.start_stage("DMAP columns", MAP_HEIGHT+1)
 
-    dmap_base = [ [ 0 for _ in range(256) ] for _ in range(256) ]   # init
+    dmap_base = array('I', bytes(DWORD_SIZE*256*256))   # init, base[y*256 + x]
 
     block_list = [EMPTY_BLOCK_DATA]     # the empty block is always the first
-    block_set = {EMPTY_BLOCK_DATA}      # speed up process: instead of searching on a list, search on the set
-
-    for y in range(MAP_HEIGHT+1):
-        for x in range(MAP_WIDTH+1):
-            
-            offset = 0
-            height = 0
-            empty_blocks_finished = False
+    block_dict = {EMPTY_BLOCK_DATA: 0}  # speed up process: instead of searching on a list, search on the dict (block data -> index)
+
+    for y, map_row in enumerate(map_rows):
+        for x, column in enumerate(map_row):
+            if column is None:
+                # empty column (see iter_UMAP_rows), there are no blocks to register
+                column_data = EMPTY_DMAP_COLUMN
+            else:
+                offset = 0
+                height = 0
+                empty_blocks_finished = False
 
-            blockd_array = []
+                blockd_array = []
 
-            for z in range(MAP_MAX_Z+1):
-                block_data = block_info_array[z][y][x]
+                for z, block_data in enumerate(column):
 
-                block_in_list = False       # boolean flag to prevent searching twice on the list
+                    # now handle block array
+                    blockd = block_dict.get(block_data)
+                    if blockd is None:
+                        blockd = len(block_list)
+                        block_list.append(block_data)
+                        block_dict[block_data] = blockd
+                        if stats is not None:
+                            stats.add_block(x, y, BLOCK_INFO_SIZE)
 
-                # now handle block array
-                if block_data not in block_set:     # possible hash collision is treated further ahead
-                    block_list.append(block_data)
-                    block_set.add(block_data)
-                else:
-                    block_in_list = True
-
-                # column logic: the first empty blocks (from bottom to top) must be accounted in 'offset'.
-                # If there are empty blocks above the first non-empty block, register blockid = 0.
+                    # column logic: the first empty blocks (from bottom to top) must be accounted in 'offset'.
+                    # If there are empty blocks above the first non-empty block, register blockid = 0.
 
-                if block_data == EMPTY_BLOCK_DATA:
-                    if not empty_blocks_finished:
-                        offset += 1
-                    else:
-                        blockd_array.append( 0 )    # empty blocks has blockd always zero
-                else:
-                    empty_blocks_finished = True
-                    height = z + 1
-
-                    # now register block in blockd array
-
-                    if block_in_list:
-                        # handle eventual hash collisions
-                        try:
-                            blockd_array.append( block_list.index(block_data) )
-                        except ValueError:
-                            print("WARNING: Hash Collision detected! Handling it...")
-                            block_list.append(block_data)
-                            blockd_array.append( len(block_list) - 1 )
+                    if block_data == EMPTY_BLOCK_DATA:
+                        if not empty_blocks_finished:
+                            offset += 1
+                        else:
+                            blockd_array.append( 0 )    # empty blocks has blockd always zero
                     else:
-                        # register the most recent added block in the array
-                        blockd_array.append( len(block_list) - 1 )  # last index of the list
+                        empty_blocks_finished = True
+                        height = z + 1
 
-            if offset == MAP_MAX_Z:
-                height = 0
-                offset = 0
+                        # now register block in blockd array
+                        blockd_array.append( blockd )
 
-            # encode column height, offset & padding
-            column_data = bytes([height, offset, 0, 0])
+                if offset == MAP_MAX_Z:
+                    height = 0
+                    offset = 0
 
-            num_blocks = height - offset
+                # encode column height, offset & padding
+                column_data = bytes([height, offset, 0, 0])
 
-            # encode blockd
-            for block_col_idx in range(num_blocks):     # ignore the highests empty blocks
-                column_data += convert_int_to_dword( blockd_array[block_col_idx] )
+                num_blocks = height - offset
 
-            try:
-                # If not raise exception, there is already the column on the array
-                dmap_base[y][x] = dword_columns_offset_array[ columns_array.index(column_data) ]
-            except ValueError:
+                # encode blockd
+                for block_col_idx in range(num_blocks):     # ignore the highests empty blocks
+                    column_data += convert_int_to_dword( blockd_array[block_col_idx] )
+
+            column_offset = columns_dict.get(column_data)
+            if column_offset is None:
                 # new column, so register it
-                columns_set.add(column_data)
+                column_offset = dword_column_offset
+                columns_dict[column_data] = column_offset
                 columns_array.append(column_data)
 
                 dword_columns_offset_array.append(dword_column_offset)
-                
-                # encode column dword to populate "data[256][256]"
-                dmap_base[y][x] = dword_column_offset
 
                 dword_column_offset += len(column_data) // DWORD_SIZE    # 4 = size of dword
 
-            percentage += 0.00001525878
+                if stats is not None:
+                    stats.add_column(x, y, column_offset, len(column_data))
 
-            curr_time = time.time()
-            if (curr_time - old_time > PERCENTAGE_UPDATE_SECONDS):
-                old_time = curr_time
-                print("{:.0%}".format(percentage), end=" \r")
+            if stats is not None:
+                stats.use_column(column_offset)
+
+            # encode column dword to populate "data[256][256]"
+            dmap_base[y*256 + x] = column_offset
+
+        if (y + 1) % PROGRESS_UPDATE_ROWS == 0:
+            progress.rows_done(y + 1)
 
-    print("100%")
-    print(f"Created columns in {(curr_time - init_time):.3f} seconds")
+    progress.end_stage()
 
     return (dmap_base, columns_array, dword_columns_offset_array, block_list)
 
+def get_block_coords(block_idx):
+    """Return the (x, y, z) coordinates of a block from its index in the UMAP chunk."""
+    return (block_idx % 256, (block_idx // 256) % 256, block_idx // (256*256))
+
+def lint_umap(gmp_path, chunk_infos, is_psx, tile_remap: dict = None) -> int:
+    """Check all blocks of the uncompressed map for tiles the PSX version can't show and malformed slopes.
+
+    Instead of checking block by block, each face (and the slope byte) is sliced from the whole map at once 
+    and only its unique values are checked. The coordinates are only searched for the bad values.
+    Returns the number of problems found.
+    """
+    if tile_remap is None:
+        tile_remap = dict()
+
+    with open(gmp_path, 'rb') as file:
+        file.seek(chunk_infos["UMAP"][0])
+        umap_data = file.read(chunk_infos["UMAP"][1])
+
+    words = array('H')
+    words.frombytes(umap_data[:len(umap_data) - len(umap_data) % BLOCK_INFO_SIZE])
+    if sys.byteorder == "big":
+        words.byteswap()
+
+    slope_bytes = umap_data[BLOCK_INFO_SIZE-1::BLOCK_INFO_SIZE]
+    num_problems = 0
+
+    # tile indices
+    if is_psx:
+        bad_tiles = dict()      # tile index -> list of (block index, face name)
+        words_per_block = BLOCK_INFO_SIZE // WORD_SIZE
+
+        for face_idx, face_name in enumerate(BLOCK_FACES):
+            face_words = words[face_idx::words_per_block]
+
+            bad_words = dict()  # face word -> tile index (after remap)
+            for face_word in set(face_words):
+                tile_idx = tile_remap.get(face_word & 1023, face_word & 1023)
+                if tile_idx > PSX_MAX_TILE_INDEX:
+                    bad_words[face_word] = tile_idx
+            if not bad_words:
+                continue
+
+            for block_idx, face_word in enumerate(face_words):
+                if face_word not in bad_words:
+                    continue
+                tile_idx = bad_words[face_word]
+                if (face_name == "lid" and tile_idx == PSX_DIAGONAL_SLOPE_TILE 
+                    and 49 <= (slope_bytes[block_idx] >> 2) <= 52):
+                    continue    # converted by fix_pc_slope
+                bad_tiles.setdefault(tile_idx, []).append((block_idx, face_name))
+
+        for tile_idx in sorted(bad_tiles):
+            faces = sorted(bad_tiles[tile_idx])
+            num_problems += len(faces)
+            coords = ", ".join(f"{get_block_coords(block_idx)} {face_name}" for block_idx, face_name in faces[:LINT_MAX_COORDS])
+            more = f" and {len(faces) - LINT_MAX_COORDS} more" if len(faces) > LINT_MAX_COORDS else ""
+            print(f"Tile {tile_idx} is above {PSX_MAX_TILE_INDEX} on {len(faces)} faces: {coords}{more}")
+
+    # slope types. All 4 block types are valid, so the type bits don't need to be checked.
+    bad_slope_bytes = { slope_byte for slope_byte in set(slope_bytes) if (slope_byte >> 2) in UNUSED_SLOPE_TYPES }
+    bad_slopes = dict()     # slope type -> list of block indices
+    if bad_slope_bytes:
+        for block_idx, slope_byte in enumerate(slope_bytes):
+            if slope_byte in bad_slope_bytes:
+                bad_slopes.setdefault(slope_byte >> 2, []).append(block_idx)
+
+    for slope_type in sorted(bad_slopes):
+        block_indices = bad_slopes[slope_type]
+        num_problems += len(block_indices)
+        coords = ", ".join(str(get_block_coords(block_idx)) for block_idx in block_indices[:LINT_MAX_COORDS])
+        more = f" and {len(block_indices) - LINT_MAX_COORDS} more" if len(block_indices) > LINT_MAX_COORDS else ""
+        print(f"Unused slope type {slope_type} on {len(block_indices)} blocks: {coords}{more}")
+
+    return num_problems
+
+def get_dmap_data_from_file(gmp_path, chunk_infos) -> dict:
+    """Read the DMAP chunk of a compressed PC map. The column data is an array of dwords."""
+    dmap_dict = dict(base=None, column_dwords=0, column_data=None, num_blocks=0, block_list=None)
+
+    with open(gmp_path, 'rb') as file:
+        file.seek(chunk_infos["DMAP"][0])
+
+        base = array('I')
+        base.frombytes(file.read(DWORD_SIZE*256*256))
+
+        column_dwords = int.from_bytes(file.read(DWORD_SIZE), 'little')
+        column_data = array('I')
+        column_data.frombytes(file.read(DWORD_SIZE*column_dwords))
+
+        if sys.byteorder == "big":
+            base.byteswap()
+            column_data.byteswap()
+
+        num_blocks = int.from_bytes(file.read(DWORD_SIZE), 'little')
+        block_info = file.read(BLOCK_INFO_SIZE*num_blocks)
+
+    dmap_dict["base"] = base
+    dmap_dict["column_dwords"] = column_dwords
+    dmap_dict["column_data"] = column_data
+    dmap_dict["num_blocks"] = num_blocks
+    dmap_dict["block_list"] = [ block_info[i:i+BLOCK_INFO_SIZE] for i in range(0, len(block_info), BLOCK_INFO_SIZE) ]
+
+    return dmap_dict
+
+def decode_dmap_column_header(column_data, column_offset):
+    """Return the height, offset and blockds of the DMAP column at column_offset (dwords).
+
+    The first dword of a column is [height, offset, 0, 0], followed by the blockds of z = offset to z = height - 1.
+    Columns without blocks have offset > height."""
+    height = column_data[column_offset] & 0xFF
+    offset = (column_data[column_offset] >> 8) & 0xFF
+    blockds = column_data[column_offset + 1 : column_offset + 1 + max(0, height - offset)]
+    return height, offset, blockds
+
+def transcode_dmap_to_cmap_columns(dmap_dict, progress: ProgressReporter = None):
+    """Create the CMAP columns directly from the DMAP columns, without expanding the map.
+
+    The PC to PSX slope fix and the complete/partial split are done once for each unique block, 
+    then each unique DMAP column is rewritten from dwords to words. Returns the same as create_cmap_columns.
+    """
+    if progress is None:
+        progress = ProgressReporter()
+    progress.start_stage("CMAP transcoding", MAP_HEIGHT+1)
+
+    complete_block_list = []
+    complete_block_dict = dict()
+
+    partial_block_list = [EMPTY_BLOCK_DATA]         # the empty block is always the first
+    partial_block_dict = {EMPTY_BLOCK_DATA: 0}
+
+    # DMAP blockd -> CMAP blockd
+    blockd_table = []
+    empty_blockds = set()   # DMAP blockds of empty blocks
+    for block_data in dmap_dict["block_list"]:
+        if is_slope(block_data):
+            block_data = fix_pc_slope(block_data)   # convert PC slope to PSX slope
+
+        if is_partial_block(block_data):
+            blockd = partial_block_dict.get(block_data)
+            if blockd is None:
+                blockd = len(partial_block_list)
+                partial_block_list.append(block_data)
+                partial_block_dict[block_data] = blockd
+            blockd += PARTIAL_BLOCKD_SHIFT
+        else:
+            blockd = complete_block_dict.get(block_data)
+            if blockd is None:
+                blockd = len(complete_block_list)
+                complete_block_list.append(block_data)
+                complete_block_dict[block_data] = blockd
+
+        if block_data == EMPTY_BLOCK_DATA:
+            empty_blockds.add(len(blockd_table))
+        blockd_table.append(blockd)
+
+    columns_array = []
+    columns_dict = dict()           # column data -> word offset of the column
+    dmap_offsets_dict = dict()      # dmap column dword offset -> cmap column word offset
+
+    word_column_offset = 0
+    word_columns_offset_array = []
+
+    cmap_base = array('I', bytes(DWORD_SIZE*256*256))  # same as create_cmap_columns
+    dmap_base = dmap_dict["base"]
+    dmap_column_data = dmap_dict["column_data"]
+
+    for y in range(MAP_HEIGHT+1):
+        for x in range(MAP_WIDTH+1):
+            dmap_offset = dmap_base[y*256 + x]
+
+            column_offset = dmap_offsets_dict.get(dmap_offset)
+            if column_offset is None:
+                # rewrite the dmap column: height, offset & padding dword + blockd dwords
+                height, offset, blockds = decode_dmap_column_header(dmap_column_data, dmap_offset)
+                num_blocks = len(blockds)
+
+                # blocks can become empty (tile remap, canonicalize), so remove them from the bottom and top of the column
+                first_block, last_block = 0, num_blocks
+                while first_block < last_block and blockds[first_block] in empty_blockds:
+                    first_block += 1
+                while last_block > first_block and blockds[last_block-1] in empty_blockds:
+                    last_block -= 1
+
+                if num_blocks == 0:
+                    column_data = bytes([height, offset])
+                elif first_block == last_block:
+                    column_data = EMPTY_CMAP_COLUMN
+                else:
+                    column_data = bytes([offset + last_block, offset + first_block])
+                    for blockd in blockds[first_block:last_block]:
+                        column_data += convert_int_to_word( blockd_table[blockd] )
+
+                # the slope fix can make different dmap columns equal
+                column_offset = columns_dict.get(column_data)
+                if column_offset is None:
+                    column_offset = word_column_offset
+                    columns_dict[column_data] = column_offset
+                    columns_array.append(column_data)
+
+                    word_columns_offset_array.append(word_column_offset)
+
+                    word_column_offset += len(column_data) // WORD_SIZE
+
+                dmap_offsets_dict[dmap_offset] = column_offset
+
+            cmap_base[y*256 + x] = column_offset
+
+        if (y + 1) % PROGRESS_UPDATE_ROWS == 0:
+            progress.rows_done(y + 1)
+
+    progress.end_stage()
+
+    return (cmap_base, columns_array, word_columns_offset_array, complete_block_list, partial_block_list)
+
 
 def search_data(input_data, header_to_found):
     for header, data in input_data:
@@ -502,41 +1046,32 @@ def create_cmap(cmap_base, columns_array, complete_block_list, partial_block_lis
                      partial_block_info=None)
 
     # create cmap base data
-    base = bytes()
-    for y in range(MAP_HEIGHT+1):
-        for x in range(MAP_WIDTH+1):
-            base += convert_int_to_word(cmap_base[y][x])
+    base = convert_array_to_bytes(array('H', cmap_base))
 
     assert len(base) == WORD_SIZE*256*256
     cmap_dict["base"] = base
 
     # create column data
-    column_data = bytes()
     column_words = word_columns_offset_array[-1] + ((len(columns_array[-1])) // WORD_SIZE)
     cmap_dict["column_words"] = column_words
-    for column in columns_array:
-        column_data += column
+    column_data = b"".join(columns_array)
 
     assert len(column_data) == WORD_SIZE*column_words # + len(columns_array[-1])
     cmap_dict["column_data"] = column_data
 
     # create complete block info data
-    complete_block_info = bytes()
     num_complete_blocks = len(complete_block_list)
     cmap_dict["num_complete_blocks"] = num_complete_blocks
-    for block_data in complete_block_list:
-        complete_block_info += block_data
+    complete_block_info = b"".join(complete_block_list)
 
     assert len(complete_block_info) == BLOCK_INFO_SIZE*num_complete_blocks
     cmap_dict["complete_block_info"] = complete_block_info
 
 
     # create partial block info data
-    partial_block_info = bytes()
     num_partial_blocks = len(partial_block_list)
     cmap_dict["num_partial_blocks"] = num_partial_blocks
-    for block_data in partial_block_list:
-        partial_block_info += get_partial_data_from_block(block_data)
+    partial_block_info = b"".join( get_partial_data_from_block(block_data) for block_data in partial_block_list )
 
     assert len(partial_block_info) == PARTIAL_BLOCK_INFO_SIZE*num_partial_blocks
     cmap_dict["partial_block_info"] = partial_block_info
@@ -553,30 +1088,23 @@ def create_dmap(dmap_base, columns_array, block_list, dword_columns_offset_array
     dmap_dict = dict(size=0, base=None, column_dwords=0, column_data=None, num_blocks=0, block_info=None)
 
     # create dmap base data
-    base = bytes()
-    for y in range(MAP_HEIGHT+1):
-        for x in range(MAP_WIDTH+1):
-            base += convert_int_to_dword(dmap_base[y][x])
+    base = convert_array_to_bytes(dmap_base)
 
     assert len(base) == DWORD_SIZE*256*256
     dmap_dict["base"] = base
 
     # create column data
-    column_data = bytes()
     column_dwords = dword_columns_offset_array[-1] + ((len(columns_array[-1])) // DWORD_SIZE)
     dmap_dict["column_dwords"] = column_dwords
-    for column in columns_array:
-        column_data += column
+    column_data = b"".join(columns_array)
     
     assert len(column_data) == DWORD_SIZE*column_dwords
     dmap_dict["column_data"] = column_data
     
     # create block info data
-    block_info = bytes()
     num_blocks = len(block_list)
     dmap_dict["num_blocks"] = num_blocks
-    for block_data in block_list:
-        block_info += block_data
+    block_info = b"".join(block_list)
 
     assert len(block_info) == BLOCK_INFO_SIZE*num_blocks
     dmap_dict["block_info"] = block_info
@@ -670,27 +1198,29 @@ def create_gmp_psx_version(output_path, cmap_info, chunk_infos, data):
 
 
 
-def create_gmp_pc_version(output_path, dmap_info, chunk_info, data):
-    with open(output_path, 'w+b') as file:
-        signature = str.encode("GBMP")
-        file.write(signature)
+def write_gmp_pc_header_and_dmap(file: _io.BufferedRandom, dmap_info):
+    signature = str.encode("GBMP")
+    file.write(signature)
 
-        version = convert_int_to_word(500)
-        file.write(version)
+    version = convert_int_to_word(500)
+    file.write(version)
 
-        # DMAP
-        chunk_header = str.encode("DMAP")
-        file.write(chunk_header)
+    # DMAP
+    chunk_header = str.encode("DMAP")
+    file.write(chunk_header)
 
-        dmap_size = convert_int_to_dword(dmap_info["size"])
-        file.write(dmap_size)
+    dmap_size = convert_int_to_dword(dmap_info["size"])
+    file.write(dmap_size)
 
-        file.write(dmap_info["base"])
-        file.write(convert_int_to_dword(dmap_info["column_dwords"]))
-        file.write(dmap_info["column_data"])
-        file.write(convert_int_to_dword(dmap_info["num_blocks"]))
-        file.write(dmap_info["block_info"])
-        
+    file.write(dmap_info["base"])
+    file.write(convert_int_to_dword(dmap_info["column_dwords"]))
+    file.write(dmap_info["column_data"])
+    file.write(convert_int_to_dword(dmap_info["num_blocks"]))
+    file.write(dmap_info["block_info"])
+
+def create_gmp_pc_version(output_path, dmap_info, chunk_info, data):
+    with open(output_path, 'w+b') as file:
+        write_gmp_pc_header_and_dmap(file, dmap_info)
 
         # ZONE
         if chunk_info["ZONE"][0] is not None:
@@ -717,10 +1247,379 @@ def create_gmp_pc_version(output_path, dmap_info, chunk_info, data):
             copy_chunk_to_file(file, "RGEN", chunk_info, data)
     return 0
 
+def create_gmp_pc_version_with_all_chunks(output_path, dmap_info, data):
+    """Like create_gmp_pc_version, but all the other chunks of the original map (see detect_headers_and_get_chunks) 
+    are written after the DMAP chunk, in their original order."""
+    with open(output_path, 'w+b') as file:
+        write_gmp_pc_header_and_dmap(file, dmap_info)
+
+        for chunk_header, chunk_data in data:
+            file.write(str.encode(chunk_header))
+            file.write(convert_int_to_dword(len(chunk_data)))
+            file.write(chunk_data)
+    return 0
+
+class DMAPEditor:
+    """Edit blocks of a compressed PC map (DMAP) without compressing the whole map again.
+
+    Only the column of each edited block is changed: a new column is appended (or an equal column 
+    is reused) when the old one is shared by other positions, and new blocks are appended to the 
+    block info. Columns and blocks that aren't used anymore are removed when saving.
+
+    Example:
+        editor = DMAPEditor("my_map.gmp")
+        editor.set_block(10, 20, 2, block_data)
+        editor.save("my_map_edited.gmp")
+    """
+    def __init__(self, gmp_path):
+        self.chunk_infos, self.data = detect_headers_and_get_chunks(gmp_path, verbose=False)
+        if self.chunk_infos["DMAP"][0] is None:
+            raise ValueError(f"{gmp_path} doesn't have a DMAP chunk")
+
+        dmap_dict = get_dmap_data_from_file(gmp_path, self.chunk_infos)
+        self.base = dmap_dict["base"]
+        self.column_data = dmap_dict["column_data"]
+        self.block_list = dmap_dict["block_list"]
+        self.loaded_column_dwords = dmap_dict["column_dwords"]     # columns before it may be shared in any way
+        self._index_blocks_and_columns()
+
+    def _index_blocks_and_columns(self):
+        """Rebuild the dicts used to find equal blocks and columns from the block list, base and column data."""
+        self.block_dict = dict()    # block data -> block index
+        for block_idx in range(len(self.block_list) - 1, -1, -1):  # the first index wins
+            self.block_dict[self.block_list[block_idx]] = block_idx
+
+        self.column_uses = dict()   # column offset -> num of positions using the column
+        self.column_dict = dict()   # column dwords (tuple) -> column offset
+        for column_offset in self.base:
+            if column_offset in self.column_uses:
+                self.column_uses[column_offset] += 1
+            else:
+                self.column_uses[column_offset] = 1
+                self.column_dict.setdefault(self.get_column_dwords(column_offset), column_offset)
+
+    def get_column_dwords(self, column_offset) -> tuple:
+        _, _, blockds = decode_dmap_column_header(self.column_data, column_offset)
+        return (self.column_data[column_offset],) + tuple(blockds)
+
+    def get_column_blockds(self, column_offset) -> list:
+        """Return the block index of each z of the column."""
+        _, offset, blockds = decode_dmap_column_header(self.column_data, column_offset)
+        column_blockds = [self.get_block_index(EMPTY_BLOCK_DATA)]*(MAP_MAX_Z+1)     # block 0 may not be the empty block
+        for z, blockd in enumerate(blockds, start=offset):
+            column_blockds[z] = blockd
+        return column_blockds
+
+    def get_block(self, x, y, z) -> bytes:
+        if not (0 <= x <= MAP_WIDTH and 0 <= y <= MAP_HEIGHT and 0 <= z <= MAP_MAX_Z):
+            raise ValueError(f"invalid block coordinates: ({x}, {y}, {z})")
+        height, offset, blockds = decode_dmap_column_header(self.column_data, self.base[y*256 + x])
+        if not offset <= z < height:
+            return EMPTY_BLOCK_DATA
+        return self.block_list[ blockds[z - offset] ]
+
+    def get_block_index(self, block_data) -> int:
+        if len(block_data) != BLOCK_INFO_SIZE:
+            raise ValueError(f"block info must have {BLOCK_INFO_SIZE} bytes")
+        block_idx = self.block_dict.get(block_data)
+        if block_idx is None:
+            block_idx = len(self.block_list)
+            self.block_list.append(block_data)
+            self.block_dict[block_data] = block_idx
+        return block_idx
+
+    def set_block(self, x, y, z, block_data):
+        if not (0 <= x <= MAP_WIDTH and 0 <= y <= MAP_HEIGHT and 0 <= z <= MAP_MAX_Z):
+            raise ValueError(f"invalid block coordinates: ({x}, {y}, {z})")
+        block_data = bytes(block_data)
+
+        old_offset = self.base[y*256 + x]
+        blockds = self.get_column_blockds(old_offset)
+        blockds[z] = self.get_block_index(block_data)
+
+        # same column logic of create_dmap_columns, but a block above 7 empty blocks is
+        # encoded as [height 8, offset 7] instead of being dropped
+        offset = 0
+        while offset <= MAP_MAX_Z and self.block_list[blockds[offset]] == EMPTY_BLOCK_DATA:
+            offset += 1
+        height = MAP_MAX_Z + 1
+        while height > 0 and self.block_list[blockds[height-1]] == EMPTY_BLOCK_DATA:
+            height -= 1
+
+        # all empty blocks between the non-empty ones use the same block index
+        empty_blockd = self.get_block_index(EMPTY_BLOCK_DATA)
+        new_dwords = tuple([height | (offset << 8)] + [ blockd if self.block_list[blockd] != EMPTY_BLOCK_DATA else empty_blockd
+                                                       for blockd in blockds[offset:height] ])
+
+        new_offset = self.column_dict.get(new_dwords)
+        if new_offset == old_offset:
+            return
+
+        if new_offset is None:
+            old_dwords = self.get_column_dwords(old_offset)
+            if (self.column_uses[old_offset] == 1 and old_offset >= self.loaded_column_dwords 
+                and len(old_dwords) == len(new_dwords)):
+                # the column was appended by the editor and only used here, so it's safe to change it
+                self.column_data[old_offset : old_offset + len(new_dwords)] = array('I', new_dwords)
+                if self.column_dict.get(old_dwords) == old_offset:
+                    del self.column_dict[old_dwords]
+                self.column_dict[new_dwords] = old_offset
+                return
+
+            # copy on write: append the new column
+            new_offset = len(self.column_data)
+            self.column_data.extend(new_dwords)
+            self.column_dict[new_dwords] = new_offset
+
+        self.column_uses[old_offset] -= 1
+        self.column_uses[new_offset] = self.column_uses.get(new_offset, 0) + 1
+        self.base[y*256 + x] = new_offset
+
+    def set_blocks(self, block_patches):
+        """Set many blocks, from an iterable of (x, y, z, block_data)."""
+        for x, y, z, block_data in block_patches:
+            self.set_block(x, y, z, block_data)
+
+    def compact(self):
+        """Remove the columns and blocks not used anymore. As in create_dmap_columns, the empty block is always the first."""
+        new_block_list = [EMPTY_BLOCK_DATA]
+        new_block_dict = {EMPTY_BLOCK_DATA: 0}  # block data -> new block index
+        new_block_indices = dict()      # old block index -> new block index
+
+        new_column_data = array('I')
+        new_offsets = dict()            # old column offset -> new column offset
+        new_column_dict = dict()        # new column dwords -> new column offset
+        new_base = array('I', bytes(DWORD_SIZE*256*256))
+
+        for i, column_offset in enumerate(self.base):
+            new_offset = new_offsets.get(column_offset)
+            if new_offset is None:
+                column_dwords = self.get_column_dwords(column_offset)
+                new_dwords = [column_dwords[0]]
+                for blockd in column_dwords[1:]:
+                    new_blockd = new_block_indices.get(blockd)
+                    if new_blockd is None:
+                        block_data = self.block_list[blockd]
+                        new_blockd = new_block_dict.get(block_data)
+                        if new_blockd is None:
+                            new_blockd = len(new_block_list)
+                            new_block_list.append(block_data)
+                            new_block_dict[block_data] = new_blockd
+                        new_block_indices[blockd] = new_blockd
+                    new_dwords.append(new_blockd)
+
+                # different columns may have become equal after the edits
+                new_dwords = tuple(new_dwords)
+                new_offset = new_column_dict.get(new_dwords)
+                if new_offset is None:
+                    new_offset = len(new_column_data)
+                    new_column_data.extend(new_dwords)
+                    new_column_dict[new_dwords] = new_offset
+                new_offsets[column_offset] = new_offset
+            new_base[i] = new_offset
+
+        self.base = new_base
+        self.column_data = new_column_data
+        self.block_list = new_block_list
+        self.loaded_column_dwords = len(new_column_data)
+        self._index_blocks_and_columns()
+
+    def save(self, output_path, compact=True):
+        """Write the edited map, with all the other chunks of the original map (see create_gmp_pc_version_with_all_chunks)."""
+        if compact:
+            self.compact()
+
+        columns_array = [ convert_array_to_bytes(self.column_data) ]
+        dmap_info = create_dmap(self.base, columns_array, self.block_list, [0])
+        create_gmp_pc_version_with_all_chunks(output_path, dmap_info, self.data)
+
+
+class CompressedMap:
+    """Read-only random access to the blocks of a compressed map (DMAP or CMAP), without decompressing it.
+
+    The file is memory-mapped and each block is found through the base offsets, the column 
+    height/offset and the block info. The most recently decoded columns are kept in a LRU cache.
+    Uncompressed maps (UMAP) can be read too, so tools can use the same interface for any map.
+
+    Example:
+        with CompressedMap("my_map_compressed.gmp") as gmp_map:
+            block_data = gmp_map.get_block(10, 20, 2)
+    """
+    def __init__(self, gmp_path, cache_size=COLUMN_CACHE_SIZE):
+        self.chunk_infos, _ = detect_headers_and_get_chunks(gmp_path, verbose=False)
+        self.cache_size = cache_size
+        self.column_cache = OrderedDict()   # column offset -> tuple with the blocks from z = 0 to z = 7
+
+        if self.chunk_infos["DMAP"][0] is not None:
+            self.map_header = "DMAP"
+        elif self.chunk_infos["CMAP"][0] is not None:
+            self.map_header = "CMAP"
+        elif self.chunk_infos["UMAP"][0] is not None:
+            self.map_header = "UMAP"
+        else:
+            raise ValueError(f"{gmp_path} doesn't have a DMAP, CMAP or UMAP chunk")
+
+        self.file = open(gmp_path, 'rb')
+        self.mm = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        chunk_offset = self.chunk_infos[self.map_header][0]
+        self.base_offset = chunk_offset
+
+        if self.map_header == "DMAP":
+            self.base_format = "<I"
+            self.base_item_size = DWORD_SIZE
+
+            column_dwords = struct.unpack_from("<I", self.mm, chunk_offset + DWORD_SIZE*256*256)[0]
+            self.columns_offset = chunk_offset + DWORD_SIZE*256*256 + DWORD_SIZE
+            blocks_offset = self.columns_offset + DWORD_SIZE*column_dwords
+            self.num_blocks = struct.unpack_from("<I", self.mm, blocks_offset)[0]
+            self.blocks_offset = blocks_offset + DWORD_SIZE
+        elif self.map_header == "UMAP":
+            self.umap_offset = chunk_offset
+        else:
+            self.base_format = "<H"
+            self.base_item_size = WORD_SIZE
+
+            column_words = struct.unpack_from("<H", self.mm, chunk_offset + WORD_SIZE*256*256)[0]
+            self.columns_offset = chunk_offset + WORD_SIZE*256*256 + WORD_SIZE
+            complete_offset = self.columns_offset + WORD_SIZE*column_words + FIRST_CMAP_PADDING_SIZE
+            self.num_complete_blocks = struct.unpack_from("<H", self.mm, complete_offset)[0]
+            self.complete_blocks_offset = complete_offset + WORD_SIZE
+            partial_offset = self.complete_blocks_offset + BLOCK_INFO_SIZE*self.num_complete_blocks + SECOND_CMAP_PADDING_SIZE
+            self.num_partial_blocks = struct.unpack_from("<H", self.mm, partial_offset)[0]
+            self.partial_blocks_offset = partial_offset + WORD_SIZE
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.column_cache.clear()
+        self.mm.close()
+        self.file.close()
+
+    def get_column_offset(self, x, y) -> int:
+        if self.map_header == "UMAP":
+            return y*256 + x    # there are no shared columns, so use the column index
+        return struct.unpack_from(self.base_format, self.mm, self.base_offset + self.base_item_size*(y*256 + x))[0]
+
+    def get_block_info(self, blockd) -> bytes:
+        if self.map_header == "DMAP":
+            offset = self.blocks_offset + BLOCK_INFO_SIZE*blockd
+            return self.mm[offset:offset+BLOCK_INFO_SIZE]
+
+        if blockd >= PARTIAL_BLOCKD_SHIFT:
+            # partial blocks only have lid word + arrow byte + slope byte
+            offset = self.partial_blocks_offset + PARTIAL_BLOCK_INFO_SIZE*(blockd - PARTIAL_BLOCKD_SHIFT)
+            return bytes(BLOCK_INFO_SIZE - PARTIAL_BLOCK_INFO_SIZE) + self.mm[offset:offset+PARTIAL_BLOCK_INFO_SIZE]
+        offset = self.complete_blocks_offset + BLOCK_INFO_SIZE*blockd
+        return self.mm[offset:offset+BLOCK_INFO_SIZE]
+
+    def decode_column(self, column_offset) -> tuple:
+        if self.map_header == "UMAP":
+            offset = self.umap_offset + BLOCK_INFO_SIZE*column_offset
+            return tuple( self.mm[offset + z*UMAP_PLANE_SIZE : offset + z*UMAP_PLANE_SIZE + BLOCK_INFO_SIZE] 
+                          for z in range(MAP_MAX_Z+1) )
+
+        if self.map_header == "DMAP":
+            offset = self.columns_offset + DWORD_SIZE*column_offset
+            blockd_format, blockd_size = "<I", DWORD_SIZE
+        else:
+            offset = self.columns_offset + WORD_SIZE*column_offset
+            blockd_format, blockd_size = "<H", WORD_SIZE
+
+        height = self.mm[offset]
+        first_z = self.mm[offset + 1]
+        blockds_offset = offset + blockd_size       # after height, offset (and padding on DMAP)
+
+        column = []
+        for z in range(MAP_MAX_Z+1):
+            if first_z <= z < height:
+                blockd = struct.unpack_from(blockd_format, self.mm, blockds_offset + blockd_size*(z - first_z))[0]
+                column.append(self.get_block_info(blockd))
+            else:
+                column.append(EMPTY_BLOCK_DATA)
+        return tuple(column)
+
+    def get_column_by_offset(self, column_offset) -> tuple:
+        column = self.column_cache.get(column_offset)
+        if column is not None:
+            self.column_cache.move_to_end(column_offset)
+            return column
+
+        column = self.decode_column(column_offset)
+        self.column_cache[column_offset] = column
+        if len(self.column_cache) > self.cache_size:
+            self.column_cache.popitem(last=False)   # least recently used
+        return column
+
+    def get_column(self, x, y) -> tuple:
+        """Return the blocks of the column at (x, y), from z = 0 to z = 7."""
+        return self.get_column_by_offset(self.get_column_offset(x, y))
+
+    def get_block(self, x, y, z) -> bytes:
+        if not (0 <= x <= MAP_WIDTH and 0 <= y <= MAP_HEIGHT and 0 <= z <= MAP_MAX_Z):
+            raise ValueError(f"invalid block coordinates: ({x}, {y}, {z})")
+        return self.get_column(x, y)[z]
+
+    @staticmethod
+    def check_rect(min_x, min_y, max_x, max_y):
+        if not (0 <= min_x <= max_x <= MAP_WIDTH and 0 <= min_y <= max_y <= MAP_HEIGHT):
+            raise ValueError(f"invalid rectangle: ({min_x}, {min_y}) - ({max_x}, {max_y})")
+
+    def get_blocks_in_rect(self, min_x, min_y, max_x, max_y, z) -> list:
+        """Return the blocks of a rectangle (limits included) at height z, as a list of rows: blocks[y - min_y][x - min_x]."""
+        if not 0 <= z <= MAP_MAX_Z:
+            raise ValueError(f"invalid block coordinates: z = {z}")
+        self.check_rect(min_x, min_y, max_x, max_y)
+        return [ [ self.get_column(x, y)[z] for x in range(min_x, max_x + 1) ] for y in range(min_y, max_y + 1) ]
+
+    def get_columns_in_rect(self, min_x, min_y, max_x, max_y) -> list:
+        """Return the columns of a rectangle (limits included), as a list of rows: columns[y - min_y][x - min_x]."""
+        self.check_rect(min_x, min_y, max_x, max_y)
+        return [ [ self.get_column(x, y) for x in range(min_x, max_x + 1) ] for y in range(min_y, max_y + 1) ]
+
+    def get_z_slice(self, z) -> list:
+        """Return all blocks at height z, as a list of rows: blocks[y][x]."""
+        return self.get_blocks_in_rect(0, 0, MAP_WIDTH, MAP_HEIGHT, z)
+
+    def get_column_offsets(self) -> list:
+        """Return the column offset of every position, base[y*256 + x]."""
+        if self.map_header == "UMAP":
+            return list(range(256*256))
+        return list(struct.unpack_from(f"<{256*256}{self.base_format[1]}", self.mm, self.base_offset))
+
+    def get_column_fingerprints(self) -> list:
+        """Return a hash of the blocks of every column, fingerprints[y*256 + x].
+
+        The hashes are 8 byte digests that don't depend on how the map is compressed or on the process, 
+        so they can be saved and compared between runs. Every unique column is decoded once to hash it."""
+        fingerprints_by_offset = dict()
+        fingerprints = []
+        for column_offset in self.get_column_offsets():
+            fingerprint = fingerprints_by_offset.get(column_offset)
+            if fingerprint is None:
+                fingerprint = hashlib.blake2b(b"".join(self.decode_column(column_offset)), digest_size=8).digest()
+                fingerprints_by_offset[column_offset] = fingerprint
+            fingerprints.append(fingerprint)
+        return fingerprints
+
+    def count_unique_blocks(self) -> int:
+        if self.map_header == "DMAP":
+            return self.num_blocks
+        if self.map_header == "CMAP":
+            return self.num_complete_blocks + self.num_partial_blocks
+        umap_data = self.mm[self.umap_offset : self.umap_offset + UMAP_PLANE_SIZE*(MAP_MAX_Z+1)]
+        return len({ umap_data[i:i+BLOCK_INFO_SIZE] for i in range(0, len(umap_data), BLOCK_INFO_SIZE) })
+
+
 # Compress map to PC version
-def compress_gmp_pc_version(block_info_array, output_path, chunk_infos, data):
+def compress_gmp_pc_version(map_rows, output_path, chunk_infos, data, progress: ProgressReporter = None, 
+                            stats: CompressionStats = None):
     print("Creating DMAP columns...")
-    dmap_base, columns_array, dword_columns_offset_array, block_list = create_dmap_columns(block_info_array)
+    dmap_base, columns_array, dword_columns_offset_array, block_list = create_dmap_columns(map_rows, progress, stats)
 
     num_dwords = dword_columns_offset_array[-1] + ((len(columns_array[-1])) // DWORD_SIZE)
 
@@ -736,9 +1635,21 @@ def compress_gmp_pc_version(block_info_array, output_path, chunk_infos, data):
 
 
 # Compress map to PSX version
-def compress_gmp_psx_version(block_info_array, output_path, chunk_infos, data):
+def compress_gmp_psx_version(map_rows, output_path, chunk_infos, data, progress: ProgressReporter = None, 
+                             stats: CompressionStats = None):
     print("Creating CMAP columns...")
-    cmap_base, columns_array, word_columns_offset_array, complete_block_list, partial_block_list = create_cmap_columns(block_info_array)
+    cmap_columns = create_cmap_columns(map_rows, progress, stats)
+    save_cmap_columns(cmap_columns, output_path, chunk_infos, data)
+
+# Convert a compressed PC map (DMAP) to PSX version
+def transcode_gmp_psx_version(dmap_dict, output_path, chunk_infos, data, progress: ProgressReporter = None):
+    print("Creating CMAP columns from DMAP...")
+    cmap_columns = transcode_dmap_to_cmap_columns(dmap_dict, progress)
+    save_cmap_columns(cmap_columns, output_path, chunk_infos, data)
+
+# Save CMAP columns to a PSX map file
+def save_cmap_columns(cmap_columns, output_path, chunk_infos, data):
+    cmap_base, columns_array, word_columns_offset_array, complete_block_list, partial_block_list = cmap_columns
 
     num_words = word_columns_offset_array[-1] + ((len(columns_array[-1])) // WORD_SIZE)
 
@@ -759,6 +1670,149 @@ def compress_gmp_psx_version(block_info_array, output_path, chunk_infos, data):
     create_gmp_psx_version(output_path, cmap_info, chunk_infos, data)
 
 
+def print_stats_heatmap(title, region_values):
+    max_value = max(region_values)
+    print(f"\n{title} (max {max_value:,}, each char is a {STATS_REGION_SIZE}x{STATS_REGION_SIZE} region):")
+    print("+" + "-"*STATS_REGIONS_PER_ROW + "+")
+    for region_y in range(STATS_REGIONS_PER_ROW):
+        line = ""
+        for region_x in range(STATS_REGIONS_PER_ROW):
+            value = region_values[region_y*STATS_REGIONS_PER_ROW + region_x]
+            if max_value == 0 or value == 0:
+                line += STATS_HEATMAP_CHARS[0]
+            else:
+                char_idx = 1 + (value*(len(STATS_HEATMAP_CHARS) - 2)) // max_value
+                line += STATS_HEATMAP_CHARS[char_idx]
+        print("|" + line + "|")
+    print("+" + "-"*STATS_REGIONS_PER_ROW + "+")
+
+def print_stats_report(stats: CompressionStats):
+    print(f"\nCompression statistics ({stats.platform.upper()}):")
+
+    print_stats_heatmap("Bytes of new columns and blocks", stats.region_bytes)
+    print_stats_heatmap("New unique columns", stats.region_columns)
+    print_stats_heatmap("New unique blocks", stats.region_blocks)
+
+    print(f"\nMost expensive regions:")
+    regions = sorted(range(len(stats.region_bytes)), key=lambda region: stats.region_bytes[region], reverse=True)
+    for region in regions[:STATS_TOP_REGIONS]:
+        if stats.region_bytes[region] == 0:
+            break
+        x = (region % STATS_REGIONS_PER_ROW)*STATS_REGION_SIZE
+        y = (region // STATS_REGIONS_PER_ROW)*STATS_REGION_SIZE
+        print(f"x {x}-{x + STATS_REGION_SIZE - 1}, y {y}-{y + STATS_REGION_SIZE - 1}: "
+              f"{stats.region_bytes[region]:,} bytes, {stats.region_columns[region]} columns, {stats.region_blocks[region]} blocks")
+
+    single_use_columns = sum(1 for column in stats.columns.values() if column[3] == 1)
+    print(f"\nColumns used only once: {single_use_columns} of {len(stats.columns)}")
+
+def write_stats_files(stats: CompressionStats, json_path, csv_path):
+    """Write the regions statistics to a CSV file and all statistics (including the columns reuse) to a JSON file."""
+    regions = []
+    for region in range(len(stats.region_bytes)):
+        regions.append(dict(x=(region % STATS_REGIONS_PER_ROW)*STATS_REGION_SIZE,
+                            y=(region // STATS_REGIONS_PER_ROW)*STATS_REGION_SIZE,
+                            unique_columns=stats.region_columns[region],
+                            unique_blocks=stats.region_blocks[region],
+                            bytes=stats.region_bytes[region]))
+
+    columns = []
+    for column_offset, (x, y, size, uses) in stats.columns.items():
+        columns.append(dict(offset=column_offset, first_x=x, first_y=y, bytes=size, uses=uses))
+
+    with open(json_path, 'w') as file:
+        json.dump(dict(platform=stats.platform, region_size=STATS_REGION_SIZE, regions=regions, columns=columns), file, indent=1)
+
+    with open(csv_path, 'w', newline='') as file:
+        writer = csv.DictWriter(file, fieldnames=["x", "y", "unique_columns", "unique_blocks", "bytes"])
+        writer.writeheader()
+        writer.writerows(regions)
+
+
+def get_cache_key(gmp_path, chunk_infos, data, map_header, platform, options: dict):
+    """Hash everything the output map depends on: the input map chunk, the other chunks, the platform, 
+    the compressor options and the compressor version."""
+    key_hash = hashlib.sha256()
+    key_hash.update(str.encode(f"{PROGRAM_VERSION}|{platform}|{json.dumps(options, sort_keys=True)}|{map_header}"))
+
+    with open(gmp_path, 'rb') as file:
+        file.seek(chunk_infos[map_header][0])
+        remaining = chunk_infos[map_header][1]
+        while remaining > 0:
+            map_data = file.read(min(remaining, CACHE_READ_SIZE))
+            if not map_data:
+                break
+            key_hash.update(map_data)
+            remaining -= len(map_data)
+
+    for header, chunk_data in data:
+        key_hash.update(str.encode(header) + convert_int_to_dword(len(chunk_data)))
+        key_hash.update(chunk_data)
+
+    return key_hash.hexdigest()
+
+def get_cached_map(cache_dir: Path, cache_key, output_path) -> bool:
+    """Copy the cached map to the output path. Return False if it isn't on the cache."""
+    cache_path = cache_dir / (cache_key + CACHE_FILE_EXTENSION)
+    try:
+        shutil.copyfile(cache_path, output_path)
+        os.utime(cache_path)    # most recently used
+    except FileNotFoundError:   # not cached, or evicted by another process
+        return False
+    return True
+
+def store_cached_map(cache_dir: Path, cache_key, output_path, max_size):
+    """Add the output map to the cache, then evict the least recently used maps until the cache fits in max_size bytes.
+
+    Maps are copied to a temporary file first and then renamed, so parallel jobs never see a partial map.
+    The output map is already saved, so if the cache can't be written it's only a warning."""
+    temp_path = None
+    try:
+        cache_dir.mkdir(parents=True, exist_ok=True)
+
+        fd, temp_path = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+        os.close(fd)
+        shutil.copyfile(output_path, temp_path)
+        os.chmod(temp_path, 0o644)      # mkstemp only allows the current user
+        os.replace(temp_path, cache_dir / (cache_key + CACHE_FILE_EXTENSION))
+    except OSError as error:
+        # e.g. on Windows the cached map can't be replaced while another job is copying it
+        print(f"WARNING: Can't save the map on the cache: {error}")
+        if temp_path is not None:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+        return
+
+    # a job killed before renaming its temporary file leaves it behind
+    for temp_path in cache_dir.glob("*.tmp"):
+        try:
+            if time.time() - temp_path.stat().st_mtime > CACHE_TEMP_FILE_MAX_AGE:
+                temp_path.unlink()
+        except OSError:     # renamed or removed by another process
+            continue
+
+    cached_maps = []
+    for cache_path in cache_dir.glob("*" + CACHE_FILE_EXTENSION):
+        try:
+            file_stat = cache_path.stat()
+        except FileNotFoundError:   # evicted by another process
+            continue
+        cached_maps.append((file_stat.st_mtime, file_stat.st_size, cache_path))
+
+    cached_maps.sort()
+    total_size = sum(size for _, size, _ in cached_maps)
+    for _, size, cache_path in cached_maps:
+        if total_size <= max_size:
+            break
+        try:
+            cache_path.unlink()
+        except OSError:     # already evicted or still being read by another process
+            continue
+        total_size -= size
+
+
 def is_opaque(block_data):
     lid_word = int.from_bytes(block_data[8:10], 'little')
     tile_idx = lid_word & 1023
@@ -842,11 +1896,148 @@ def remove_hidden_surfaces(block_info_array):
     return block_info_array
 
 
+def get_changed_rects(changed_positions) -> list:
+    """Group the changed (x, y) positions in rectangles: the runs of each row are merged with 
+    equal runs of the rows above. Returns a list of [min_x, min_y, max_x, max_y]."""
+    rows = dict()   # y -> list of x
+    for x, y in changed_positions:
+        rows.setdefault(y, []).append(x)
+
+    rects = []
+    open_rects = dict()     # (min_x, max_x) -> rect that ends on the previous row
+    for y in sorted(rows):
+        runs = []
+        for x in sorted(rows[y]):
+            if runs and runs[-1][1] == x - 1:
+                runs[-1][1] = x
+            else:
+                runs.append([x, x])
+
+        new_open_rects = dict()
+        for min_x, max_x in runs:
+            rect = open_rects.get((min_x, max_x))
+            if rect is not None and rect[3] == y - 1:
+                rect[3] = y
+            else:
+                rect = [min_x, y, max_x, y]
+                rects.append(rect)
+            new_open_rects[(min_x, max_x)] = rect
+        open_rects = new_open_rects
+
+    return rects
+
+def diff_maps(old_map: CompressedMap, new_map: CompressedMap) -> dict:
+    """Compare two maps column by column. Only the columns with different fingerprints are read to find the changed blocks."""
+    old_fingerprints = old_map.get_column_fingerprints()
+    new_fingerprints = new_map.get_column_fingerprints()
+
+    changed_positions = []
+    changed_blocks = []     # [x, y, z, old block data, new block data]
+    changed_blocks_per_z = [0]*(MAP_MAX_Z+1)
+
+    for i in range(256*256):
+        if old_fingerprints[i] == new_fingerprints[i]:
+            continue
+        x, y = i % 256, i // 256
+        old_column = old_map.get_column(x, y)
+        new_column = new_map.get_column(x, y)
+        if old_column == new_column:    # hash collision
+            continue
+
+        changed_positions.append((x, y))
+        for z in range(MAP_MAX_Z+1):
+            if old_column[z] != new_column[z]:
+                changed_blocks.append([x, y, z, old_column[z], new_column[z]])
+                changed_blocks_per_z[z] += 1
+
+    return dict(old_map=dict(type=old_map.map_header, 
+                             unique_columns=len(set(old_fingerprints)), 
+                             unique_blocks=old_map.count_unique_blocks()),
+                new_map=dict(type=new_map.map_header, 
+                             unique_columns=len(set(new_fingerprints)), 
+                             unique_blocks=new_map.count_unique_blocks()),
+                changed_columns=len(changed_positions),
+                changed_rects=get_changed_rects(changed_positions),
+                changed_blocks_per_z=changed_blocks_per_z,
+                changed_blocks=changed_blocks)
+
+def print_map_diff(map_diff: dict, show_blocks=False):
+    old_map, new_map = map_diff["old_map"], map_diff["new_map"]
+    print(f"Old map: {old_map['type']}, {old_map['unique_columns']} unique columns, {old_map['unique_blocks']} unique blocks")
+    print(f"New map: {new_map['type']}, {new_map['unique_columns']} unique columns, {new_map['unique_blocks']} unique blocks")
+    print(f"Unique columns: {new_map['unique_columns'] - old_map['unique_columns']:+}, "
+          f"unique blocks: {new_map['unique_blocks'] - old_map['unique_blocks']:+}")
+    print(f"\nChanged columns: {map_diff['changed_columns']}")
+
+    for min_x, min_y, max_x, max_y in map_diff["changed_rects"]:
+        print(f"x {min_x}-{max_x}, y {min_y}-{max_y}")
+
+    if map_diff["changed_columns"] > 0:
+        print("\nChanged blocks per z:")
+        for z, num_blocks in enumerate(map_diff["changed_blocks_per_z"]):
+            print(f"z {z}: {num_blocks}")
+
+    if show_blocks:
+        print("")
+        for x, y, z, old_block, new_block in map_diff["changed_blocks"]:
+            print(f"({x}, {y}, {z}): {old_block.hex()} -> {new_block.hex()}")
+
+def diff_main(argv):
+    parser = argparse.ArgumentParser(f"{PROGRAM_NAME} diff", description="compare the blocks of two maps (UMAP, DMAP or CMAP)")
+    parser.add_argument("old_gmp_path")
+    parser.add_argument("new_gmp_path")
+    parser.add_argument("-b", "--blocks", action="store_true", help="show every changed block")
+    parser.add_argument("-j", "--json", action="store_true", help="print the differences as JSON")
+    args = parser.parse_args(argv)
+
+    for gmp_path in [args.old_gmp_path, args.new_gmp_path]:
+        if not Path(gmp_path).exists():
+            print(f"Input gmp file doesn't exists. Input Path: {gmp_path}")
+            sys.exit(-1)
+
+    try:
+        with CompressedMap(args.old_gmp_path) as old_map, CompressedMap(args.new_gmp_path) as new_map:
+            map_diff = diff_maps(old_map, new_map)
+    except ValueError as error:
+        print(f"ERROR: {error}")
+        sys.exit(-1)
+
+    if args.json:
+        for changed_block in map_diff["changed_blocks"]:
+            changed_block[3] = changed_block[3].hex()
+            changed_block[4] = changed_block[4].hex()
+        print(json.dumps(map_diff))
+    else:
+        print_map_diff(map_diff, args.blocks)
+
+    # like diff, exit code 1 if the maps are different
+    if map_diff["changed_columns"] > 0:
+        sys.exit(1)
+
+
 def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "diff":
+        diff_main(sys.argv[2:])
+        return
+
     parser = argparse.ArgumentParser(PROGRAM_NAME)
     parser.add_argument("gmp_path")
     parser.add_argument("platform")
     parser.add_argument("-r", "--remove_hidden", action="store_true")
+    parser.add_argument("-p", "--progress", choices=PROGRESS_SINKS, default="tty",
+                        help="how to report progress: progress bar (tty), nothing (quiet) or JSON lines on stderr (json)")
+    parser.add_argument("-s", "--stats", action="store_true",
+                        help="report which regions of the map add more unique columns and blocks")
+    parser.add_argument("-c", "--cache", metavar="CACHE_DIR",
+                        help="reuse the compressed map from this folder if the input map and options didn't change")
+    parser.add_argument("--cache_max_mb", type=int, default=CACHE_DEFAULT_MAX_MB,
+                        help="maximum size of the cache folder, the least recently used maps are deleted")
+    parser.add_argument("-l", "--lint", action="store_true",
+                        help="check the map for tiles the PSX version can't show and malformed slopes before compressing")
+    parser.add_argument("-t", "--tile_remap", metavar="REMAP_FILE",
+                        help="replace tile indices before compressing, one 'old_tile new_tile' pair per line")
+    parser.add_argument("-n", "--canonicalize", action="store_true",
+                        help="clear block bits that don't change anything in the game, so more blocks and columns are merged")
     args = parser.parse_args()
 
     if (not args.gmp_path
@@ -875,35 +2066,124 @@ def main():
     print(f"\nOpening file {gmp_path}...\n")
     chunk_infos, data = detect_headers_and_get_chunks(gmp_path)
 
-    if chunk_infos["UMAP"][0] is None:
+    # a PC compressed map can be converted to PSX without the uncompressed data
+    transcode_dmap = is_psx and chunk_infos["UMAP"][0] is None and chunk_infos["DMAP"][0] is not None
+
+    if chunk_infos["UMAP"][0] is None and not transcode_dmap:
         print("ERROR: There is nothing to compress. UMAP header is missing.")
         sys.exit(-1)
 
-    print("Getting block info from uncompressed data...")
-    block_info_array = get_block_info_data_from_UMAP(gmp_path, chunk_infos)
+    tile_remap = None
+    if args.tile_remap is not None:
+        try:
+            tile_remap = load_tile_remap(args.tile_remap)
+        except (OSError, ValueError) as error:
+            print(f"ERROR: Can't read the tile remap file {args.tile_remap}: {error}")
+            sys.exit(-1)
 
-    
-    if args.remove_hidden:
-        print("Removing Hidden Surfaces...")
-        block_info_array = remove_hidden_surfaces(block_info_array)
+    if args.lint and transcode_dmap:
+        print("The lint is only available for maps with UMAP chunk.")
+    elif args.lint:
+        print("Checking blocks...")
+        num_problems = lint_umap(gmp_path, chunk_infos, is_psx, tile_remap)
+        print(f"Found {num_problems} problems.\n")
 
     # get output folder path
     parent = gmp_path.parent
     map_name = get_filename(gmp_path)
-    
-    # now compress the map
+
     if not is_psx:
         output_path = parent / (map_name + "_compressed.gmp")
-        compress_gmp_pc_version(block_info_array, output_path, chunk_infos, data)
-        print("\nSuccess! GMP compressed!")
     else:
         output_path = parent / (map_name + "_psx_compressed.gmp")
+
+    cache_key = None
+    if args.cache is not None:
+        map_header = "DMAP" if transcode_dmap else "UMAP"
+        cache_options = dict(remove_hidden=args.remove_hidden, 
+                             tile_remap=sorted(tile_remap.items()) if tile_remap else None,
+                             canonicalize=args.canonicalize)
+        cache_key = get_cache_key(gmp_path, chunk_infos, data, map_header, args.platform.lower(), cache_options)
+
+        # the statistics need the compression, so the cache is only updated
+        if not args.stats and get_cached_map(Path(args.cache), cache_key, output_path):
+            print(f"Map found on cache. Output: {output_path}")
+            if not is_psx:
+                print("\nSuccess! GMP compressed!")
+            else:
+                print("\nSuccess! GMP converted to PSX map!")
+            return
+
+    if transcode_dmap:
+        print("UMAP header is missing, converting the DMAP chunk to CMAP.")
+        map_rows = None
+    elif args.remove_hidden:
+        # this step needs the whole map in memory
+        print("Getting block info from uncompressed data...")
+        block_info_array = get_block_info_data_from_UMAP(gmp_path, chunk_infos)
+
+        print("Removing Hidden Surfaces...")
+        block_info_array = remove_hidden_surfaces(block_info_array)
+        map_rows = iter_block_info_array_rows(block_info_array)
+    else:
+        # stream the uncompressed data row by row
+        map_rows = iter_UMAP_rows(gmp_path, chunk_infos)
+
+    if tile_remap and map_rows is not None:
+        map_rows = remap_map_rows(map_rows, tile_remap)
+
+    canonical_counts = dict()
+    if args.canonicalize and map_rows is not None:
+        map_rows = canonicalize_map_rows(map_rows, canonical_counts)
+
+    progress = ProgressReporter(create_progress_sink(args.progress))
+
+    stats = None
+    if args.stats and transcode_dmap:
+        print("The statistics are only available when compressing an UMAP chunk.")
+    elif args.stats:
+        stats = CompressionStats(args.platform.lower())
+
+    # now compress the map
+    success = False
+    if not is_psx:
+        compress_gmp_pc_version(map_rows, output_path, chunk_infos, data, progress, stats)
+        print("\nSuccess! GMP compressed!")
+        success = True
+    else:
         try:
-            compress_gmp_psx_version(block_info_array, output_path, chunk_infos, data)
+            if transcode_dmap:
+                dmap_dict = get_dmap_data_from_file(gmp_path, chunk_infos)
+                if tile_remap:
+                    dmap_dict["block_list"] = [ remap_block_tiles(block_data, tile_remap) for block_data in dmap_dict["block_list"] ]
+                if args.canonicalize:
+                    canonicalize_dmap_blocks(dmap_dict, canonical_counts)
+                transcode_gmp_psx_version(dmap_dict, output_path, chunk_infos, data, progress)
+            else:
+                compress_gmp_psx_version(map_rows, output_path, chunk_infos, data, progress, stats)
             print("\nSuccess! GMP converted to PSX map!")
+            success = True
         except WordConvertionException:
             print("Error: Your map has more columns or unique blocks than a CMAP chunk can store (65535). Process aborted.")
 
+    if canonical_counts:
+        print(f"\nCanonicalize: merged {canonical_counts['blocks'] - canonical_counts['canonical_blocks']} of "
+              f"{canonical_counts['blocks']} unique blocks and {canonical_counts['columns'] - canonical_counts['canonical_columns']} of "
+              f"{canonical_counts['columns']} unique columns")
+
+    # the statistics are reported even if the map doesn't fit on a CMAP chunk
+    if stats is not None:
+        print_stats_report(stats)
+
+        stats_name = f"{map_name}_{stats.platform}_stats"
+        json_path = parent / (stats_name + ".json")
+        csv_path = parent / (stats_name + ".csv")
+        write_stats_files(stats, json_path, csv_path)
+        print(f"\nStatistics saved to {json_path} and {csv_path}")
+
+    if success and cache_key is not None:
+        store_cached_map(Path(args.cache), cache_key, output_path, args.cache_max_mb*1024*1024)
+
     return
 
 
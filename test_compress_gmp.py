@@ -0,0 +1,78 @@
+import os
+import tempfile
+import unittest
+from array import array
+
+from compress_gmp import (DMAPEditor, CompressedMap, EMPTY_BLOCK_DATA, MAP_MAX_Z, convert_array_to_bytes, 
+                          create_dmap, create_gmp_pc_version_with_all_chunks, detect_headers_and_get_chunks)
+
+ROAD_BLOCK = bytes([1, 0, 2, 0, 3, 0, 4, 0, 5, 0, 0, 0])
+WALL_BLOCK = bytes([6, 0, 6, 0, 6, 0, 6, 0, 7, 0, 0, 0])
+ZONE_DATA = bytes(range(16))
+
+EMPTY_COLUMN_HEADER = (MAP_MAX_Z+1) << 8    # height 0, offset 8
+
+def write_dmap_map(gmp_path, column_data, base, block_list, data):
+    column_data = array('I', column_data)
+    dmap_info = create_dmap(array('I', base), [ convert_array_to_bytes(column_data) ], block_list, [0])
+    create_gmp_pc_version_with_all_chunks(gmp_path, dmap_info, data)
+
+class DMAPEditorTest(unittest.TestCase):
+    """Set blocks, save the map and read it back with CompressedMap."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.map_path = os.path.join(self.temp_dir.name, "map.gmp")
+        self.edited_path = os.path.join(self.temp_dir.name, "map_edited.gmp")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def edit_and_read_back(self, block_patches):
+        editor = DMAPEditor(self.map_path)
+        editor.set_blocks(block_patches)
+        for x, y, z, block_data in block_patches:
+            self.assertEqual(editor.get_block(x, y, z), block_data)
+        editor.save(self.edited_path)
+
+        with CompressedMap(self.edited_path) as gmp_map:
+            for x, y, z, block_data in block_patches:
+                self.assertEqual(gmp_map.get_block(x, y, z), block_data)
+            return [ gmp_map.get_column(x, y) for x, y, _, _ in block_patches ]
+
+    def test_round_trip(self):
+        write_dmap_map(self.map_path, [EMPTY_COLUMN_HEADER], [0]*(256*256), [EMPTY_BLOCK_DATA], [("ZONE", ZONE_DATA)])
+        columns = self.edit_and_read_back([(10, 20, 0, ROAD_BLOCK), (10, 20, 3, WALL_BLOCK), (255, 255, 2, WALL_BLOCK)])
+        self.assertEqual(columns[0], (ROAD_BLOCK,) + (EMPTY_BLOCK_DATA,)*2 + (WALL_BLOCK,) + (EMPTY_BLOCK_DATA,)*4)
+
+        with CompressedMap(self.edited_path) as gmp_map:
+            self.assertEqual(gmp_map.get_block(11, 20, 0), EMPTY_BLOCK_DATA)
+        _, data = detect_headers_and_get_chunks(self.edited_path, verbose=False)
+        self.assertEqual(data, [("ZONE", ZONE_DATA)])
+
+    def test_block_above_empty_blocks(self):
+        write_dmap_map(self.map_path, [EMPTY_COLUMN_HEADER], [0]*(256*256), [EMPTY_BLOCK_DATA], [])
+        columns = self.edit_and_read_back([(5, 5, MAP_MAX_Z, ROAD_BLOCK)])
+        self.assertEqual(columns[0], (EMPTY_BLOCK_DATA,)*MAP_MAX_Z + (ROAD_BLOCK,))
+
+    def test_first_block_not_empty(self):
+        # block 0 is a road, only used by the column at (0, 0)
+        base = [2]*(256*256)
+        base[0] = 0
+        write_dmap_map(self.map_path, [1, 0, EMPTY_COLUMN_HEADER], base, [ROAD_BLOCK, EMPTY_BLOCK_DATA], [])
+        columns = self.edit_and_read_back([(1, 0, 3, WALL_BLOCK), (0, 0, 2, WALL_BLOCK)])
+        self.assertEqual(columns[0], (EMPTY_BLOCK_DATA,)*3 + (WALL_BLOCK,) + (EMPTY_BLOCK_DATA,)*4)
+        self.assertEqual(columns[1], (ROAD_BLOCK, EMPTY_BLOCK_DATA, WALL_BLOCK) + (EMPTY_BLOCK_DATA,)*5)
+
+    def test_invalid_coordinates(self):
+        write_dmap_map(self.map_path, [EMPTY_COLUMN_HEADER], [0]*(256*256), [EMPTY_BLOCK_DATA], [])
+        editor = DMAPEditor(self.map_path)
+        for coords in [(256, 0, 0), (-1, 0, 0), (0, 0, MAP_MAX_Z+1)]:
+            with self.assertRaises(ValueError):
+                editor.get_block(*coords)
+            with self.assertRaises(ValueError):
+                editor.set_block(*coords, ROAD_BLOCK)
+
+
+if __name__ == "__main__":
+    unittest.main()